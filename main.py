@@ -1,9 +1,9 @@
-from fastapi import FastAPI, Request, Form, HTTPException
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, Request, Form, HTTPException, Header, Query
+from fastapi.responses import HTMLResponse, FileResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Optional, Tuple
 import numpy as np
 import pandas as pd
 from bayesian_testing.experiments import (
@@ -11,13 +11,24 @@ from bayesian_testing.experiments import (
     DeltaLognormalDataTest,
     ExponentialDataTest,
 )
+from bayesian_testing.metrics.posteriors import (
+    beta_posteriors_all,
+    exp_gamma_posteriors_all,
+    lognormal_posteriors,
+)
 from dataclasses import dataclass
 import json
 import os
 import logging
 import traceback
+import cProfile
+import io
+import pstats
+import secrets
+import uuid
+import warnings
 from datetime import datetime
-from scipy import stats
+from scipy import special, stats
 
 # Configure logging
 log_level = os.environ.get("LOG_LEVEL", "INFO").upper()
@@ -41,6 +52,255 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 # Set up Jinja2 templates
 templates = Jinja2Templates(directory="templates")
 
+# Opt-in profiling of single analysis requests.
+# Profiling is disabled unless JANUS_ADMIN_TOKEN is set, and only callers
+# presenting that token may request it or download the stored profiles.
+PROFILE_DIR_DEFAULT = "profiles"
+MAX_PROFILES_DEFAULT = 50
+
+
+def get_admin_token() -> Optional[str]:
+    return os.environ.get("JANUS_ADMIN_TOKEN") or None
+
+
+def get_profile_dir() -> str:
+    return os.environ.get("JANUS_PROFILE_DIR", PROFILE_DIR_DEFAULT)
+
+
+def is_privileged(admin_token: Optional[str]) -> bool:
+    expected = get_admin_token()
+    if expected is None or admin_token is None:
+        return False
+    # compare bytes, header values may hold non-ASCII (latin-1) characters
+    return secrets.compare_digest(admin_token.encode(), expected.encode())
+
+
+def save_profile(profiler: cProfile.Profile) -> str:
+    """
+    Dump the profiler stats to the profile directory and return the profile id.
+    Only the most recent JANUS_MAX_PROFILES profiles are kept, and never fewer
+    than the one just stored.
+    """
+    profile_dir = get_profile_dir()
+    os.makedirs(profile_dir, exist_ok=True)
+    profile_id = f"{datetime.now().strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    profile_file = f"{profile_id}.prof"
+    profiler.dump_stats(os.path.join(profile_dir, profile_file))
+
+    max_profiles = max(get_env_number("JANUS_MAX_PROFILES", MAX_PROFILES_DEFAULT), 1)
+    older = sorted(
+        (
+            f
+            for f in os.listdir(profile_dir)
+            if f.endswith(".prof") and f != profile_file
+        ),
+        key=lambda f: os.path.getmtime(os.path.join(profile_dir, f)),
+    )
+    for old in older[: max(len(older) - (max_profiles - 1), 0)]:
+        os.remove(os.path.join(profile_dir, old))
+    return profile_id
+
+
+def get_profile_path(profile_id: str) -> str:
+    # Profile ids are generated by save_profile, reject anything else
+    if not profile_id.replace("-", "").isalnum():
+        raise HTTPException(status_code=404, detail="Profile not found")
+    path = os.path.join(get_profile_dir(), f"{profile_id}.prof")
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return path
+
+
+def pairwise_comparison(samples: np.ndarray, interval: float = 0.95) -> dict:
+    """
+    Compare every pair of variants from one set of posterior draws.
+
+    `samples` has shape (n_variants, sim_count). Cell [i][j] of each returned
+    matrix compares variant i against variant j: the probability of i being
+    better, the expected loss of choosing i instead of j and the credible
+    interval of the lift of i over j.
+    """
+    challenger = samples[:, None, :]
+    reference = samples[None, :, :]
+
+    prob_being_better = (challenger > reference).mean(axis=2)
+    # draws of posteriors with few conversions can overflow to inf
+    with np.errstate(over="ignore", invalid="ignore"):
+        expected_loss = np.maximum(reference - challenger, 0).mean(axis=2)
+    quantiles = [(1 - interval) / 2, (1 + interval) / 2]
+    if (samples > 0).all():
+        # the ratio j / i is the inverse of i / j, so only half of the pairs
+        # need their quantiles computed
+        upper = np.triu_indices(len(samples), 1)
+        lower = (upper[1], upper[0])
+        ratio_low, ratio_high = np.quantile(
+            samples[upper[0]] / samples[upper[1]], quantiles, axis=1
+        )
+        lift_lower = np.empty((len(samples), len(samples)))
+        lift_upper = np.empty((len(samples), len(samples)))
+        lift_lower[upper], lift_upper[upper] = ratio_low - 1, ratio_high - 1
+        lift_lower[lower], lift_upper[lower] = 1 / ratio_high - 1, 1 / ratio_low - 1
+    else:
+        # lift is undefined for zero draws of the reference variant
+        with np.errstate(divide="ignore", invalid="ignore"):
+            lift = np.where(reference > 0, challenger / reference - 1, np.nan)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+            lift_lower, lift_upper = np.nanquantile(lift, quantiles, axis=2)
+
+    # a variant is not compared with itself
+    for matrix in (prob_being_better, expected_loss, lift_lower, lift_upper):
+        np.fill_diagonal(matrix, np.nan)
+
+    return {
+        "prob_being_better": prob_being_better,
+        "expected_loss": expected_loss,
+        "lift_lower": lift_lower,
+        "lift_upper": lift_upper,
+    }
+
+
+def normal_approximation_error(distribution, **params) -> float:
+    """
+    Bound on the total variation distance between the joint posterior of
+    independent variants and its moment-matched normal approximation.
+
+    `distribution` is a scipy distribution and `params` hold its parameters for
+    each variant. The densities are integrated numerically over +-10 standard
+    deviations, and the mass of both tails outside that range is added. The
+    bound is the smallest of the sum of the per variant total variations and
+    the Hellinger bound sqrt(1 - BC^2), where the Bhattacharyya coefficient BC
+    of the joint posterior is the product of the per variant ones.
+    """
+    params = {k: np.asarray(v, dtype=float)[:, None] for k, v in params.items()}
+    mean, sd = distribution.mean(**params), distribution.std(**params)
+    z = np.linspace(-10, 10, 2001)
+    x = mean + sd * z
+    posterior_pdf = distribution.pdf(x, **params)
+    normal_pdf = stats.norm.pdf(z) / sd
+    tails = (
+        distribution.cdf(x[:, :1], **params)
+        + distribution.sf(x[:, -1:], **params)
+        + 2 * stats.norm.sf(10)
+    )[:, 0]
+
+    total_variation = 0.5 * (
+        np.trapz(np.abs(posterior_pdf - normal_pdf), x, axis=1) + tails
+    )
+    # squared Hellinger distance, 1 - BC
+    hellinger_2 = 0.5 * (
+        np.trapz((np.sqrt(posterior_pdf) - np.sqrt(normal_pdf)) ** 2, x, axis=1) + tails
+    )
+    joint_bc_2 = np.exp(2 * np.log1p(-np.minimum(hellinger_2, 1)).sum())
+    return float(min(total_variation.sum(), np.sqrt(1 - joint_bc_2)))
+
+
+def gaussian_prob_best_and_loss(
+    means: np.ndarray, sds: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, float]:
+    """
+    Probability of being best and expected loss of independent normal
+    posteriors, without simulation.
+
+    P(best_i) is the orthant probability P(X_i - X_k > 0 for all k), which for
+    independent variants reduces to the 1-D integral of
+    phi(z) * prod_k Phi((mu_i + sd_i * z - mu_k) / sd_k) over z. E[max] follows
+    from the same integrand, and the expected loss is E[max] - mu_i.
+    Also returns the quadrature residue |1 - sum(P(best))|.
+    """
+    z = np.linspace(-8, 8, 801)
+    # x[i, g]: value of variant i at grid point g of its own posterior
+    x = means[:, None] + sds[:, None] * z[None, :]
+    # log Phi of every variant k at every point of every variant i: (i, k, g)
+    log_cdf = special.log_ndtr(
+        (x[:, None, :] - means[None, :, None]) / sds[None, :, None]
+    )
+    others = log_cdf.sum(axis=1) - np.diagonal(log_cdf, axis1=0, axis2=1).T
+    best_density = np.exp(others - z[None, :] ** 2 / 2) / np.sqrt(2 * np.pi)
+
+    pbbs = np.trapz(best_density, z, axis=1)
+    expected_max = np.trapz(best_density * x, z, axis=1).sum()
+    return pbbs, expected_max - means, abs(1 - pbbs.sum())
+
+
+@dataclass(frozen=True)
+class GaussianFastPath:
+    """
+    Thresholds for replacing posterior simulation by moment-matched normal
+    approximations. The fast path is used for a metric when it is enabled,
+    every variant has at least `min_impressions` impressions and
+    `min_conversions` conversions, and the bound on the error of P(best) is
+    below `max_error`. ARPU has no guaranteed bound, so it only uses the fast
+    path when `heuristic_arpu` is set.
+    """
+
+    min_impressions: int = 1_000_000
+    min_conversions: int = 10_000
+    max_error: float = 0.005
+    enabled: bool = True
+    heuristic_arpu: bool = False
+
+
+def get_env_number(name: str, default, cast=int):
+    """
+    Numeric setting from the environment, falling back to `default` with a
+    warning when it cannot be parsed or is negative.
+    """
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    try:
+        number = cast(value)
+    except ValueError:
+        number = None
+    if number is None or not number >= 0:
+        logger.warning(f"Invalid {name}={value!r}, using default {default}")
+        return default
+    return number
+
+
+def get_env_flag(name: str, default: bool) -> bool:
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.lower() in ("1", "true", "yes")
+
+
+def get_fast_path_config() -> GaussianFastPath:
+    return GaussianFastPath(
+        min_impressions=get_env_number(
+            "JANUS_FAST_PATH_MIN_IMPRESSIONS", GaussianFastPath.min_impressions
+        ),
+        min_conversions=get_env_number(
+            "JANUS_FAST_PATH_MIN_CONVERSIONS", GaussianFastPath.min_conversions
+        ),
+        max_error=get_env_number(
+            "JANUS_FAST_PATH_MAX_ERROR", GaussianFastPath.max_error, float
+        ),
+        enabled=get_env_flag("JANUS_FAST_PATH_ENABLED", GaussianFastPath.enabled),
+        heuristic_arpu=get_env_flag(
+            "JANUS_FAST_PATH_HEURISTIC_ARPU", GaussianFastPath.heuristic_arpu
+        ),
+    )
+
+
+def pairwise_stats_to_json(pairwise_reports: dict, variant_names: List[str]) -> dict:
+    """
+    Matrices of `get_pairwise_reports` as nested lists, with null on the
+    diagonal and for undefined or overflowing (non-finite) values, which JSON
+    cannot hold.
+    """
+    return {
+        metric: {
+            "variants": variant_names,
+            **{
+                stat: df.astype(object).where(np.isfinite(df), None).values.tolist()
+                for stat, df in stats_.items()
+            },
+        }
+        for metric, stats_ in pairwise_reports.items()
+    }
+
 
 @dataclass
 class Variant:
@@ -56,19 +316,103 @@ class WebsiteExperiment:
     Focused in conversion, revenue and ARPU metrics.
     """
 
-    def __init__(self, variants: List[Variant], baseline_variant: str):
+    def __init__(
+        self,
+        variants: List[Variant],
+        baseline_variant: str,
+        fast_path: Optional[GaussianFastPath] = None,
+    ):
         self.variants: List[Variant] = variants
         self.variants_results = []
         self.baseline_variant: str = baseline_variant
+        # None reads the JANUS_FAST_PATH_* environment variables when running
+        self.fast_path: Optional[GaussianFastPath] = fast_path
+        # metric -> {"error_bound", "guaranteed"}, for metrics using the fast path
+        self.approximation_errors = {}
+
+    def fast_path_config(self) -> GaussianFastPath:
+        if self.fast_path is not None:
+            return self.fast_path
+        return get_fast_path_config()
+
+    def eligible_for_fast_path(self, impressions: bool = True) -> bool:
+        config = self.fast_path_config()
+        if not config.enabled:
+            return False
+        return all(
+            v.conversions >= config.min_conversions
+            and (not impressions or v.impressions >= config.min_impressions)
+            for v in self.variants
+        )
+
+    def gaussian_fast_path(
+        self,
+        metric: str,
+        distribution,
+        guaranteed: bool = True,
+        min_is_best: bool = False,
+        **params,
+    ):
+        """
+        Evaluate a metric from the exact posterior of each variant, given as a
+        scipy distribution and its parameters per variant, using moment-matched
+        normal approximations.
+
+        The P(best) error is bounded by the total variation distance between
+        the joint posterior and its approximation (see
+        normal_approximation_error), plus the quadrature residue. Returns None
+        when that bound exceeds `max_error` or is not finite, so that the caller
+        falls back to simulation. `guaranteed` is False when `distribution` is
+        itself an approximation of the posterior, so the bound is heuristic.
+        With `min_is_best`, as in bayesian_testing, the lowest value is best
+        and the expected loss is E[X_i] - E[min X].
+        """
+        max_error = self.fast_path_config().max_error
+        error = normal_approximation_error(distribution, **params)
+        if not error <= max_error:
+            logger.info(
+                f"Normal approximation for {metric} rejected, error bound {error:.2g}"
+            )
+            return None
+        sign = -1 if min_is_best else 1
+        pbbs, loss, residue = gaussian_prob_best_and_loss(
+            sign * np.asarray(distribution.mean(**params), dtype=float),
+            np.asarray(distribution.std(**params), dtype=float),
+        )
+        error += residue
+        if not error <= max_error:
+            return None
+
+        logger.info(f"Using normal approximation for {metric}, error bound {error:.2g}")
+        self.approximation_errors[metric] = {
+            "error_bound": error,
+            "guaranteed": guaranteed,
+        }
+        return pbbs, loss
 
     def run_conversion_experiment(self, sim_count: int = 100_000, show=False):
+        self.approximation_errors.pop("conversion", None)
         self.conversion_test: BinaryDataTest = BinaryDataTest()
         for v in self.variants:
             self.conversion_test.add_variant_data_agg(
                 v.name, totals=v.impressions, positives=v.conversions
             )
 
-        self.conversion_results = self.conversion_test.evaluate()
+        approximation = None
+        if self.eligible_for_fast_path():
+            test = self.conversion_test
+            approximation = self.gaussian_fast_path(
+                "conversion",
+                stats.beta,
+                a=np.add(test.a_priors, test.positives),
+                b=np.add(test.b_priors, np.subtract(test.totals, test.positives)),
+            )
+        if approximation is None:
+            self.conversion_results = self.conversion_test.evaluate()
+        else:
+            self.conversion_results = self.approximated_results(
+                self.conversion_test, *approximation
+            )
         # Create the posterior distributions for conversion rates
         # For binary data, the posterior is a Beta distribution with parameters:
         # alpha = a_prior + positives, beta = b_prior + (totals - positives)
@@ -91,23 +435,39 @@ class WebsiteExperiment:
             )
 
     def run_arpu_experiment(self, sim_count: int = 100_000, show=False):
+        self.approximation_errors.pop("arpu", None)
         self.arpu_test: DeltaLognormalDataTest = DeltaLognormalDataTest()
         for v in self.variants:
-            rev_logs = (
-                [np.log(v.revenue / v.conversions)] * v.conversions
-                if v.conversions > 0
-                else []
-            )
+            # Every conversion is assumed to have the average ticket, so the sums of
+            # log revenues are closed form instead of summing one term per conversion
+            rev_log = np.log(v.revenue / v.conversions) if v.conversions > 0 else 0
             self.arpu_test.add_variant_data_agg(
                 v.name,
                 totals=v.impressions,
                 positives=v.conversions,
                 sum_values=v.revenue,
-                sum_logs=sum(rev_logs) if rev_logs else 0,
-                sum_logs_2=sum([np.square(l) for l in rev_logs]) if rev_logs else 0,
+                sum_logs=v.conversions * rev_log,
+                sum_logs_2=v.conversions * np.square(rev_log),
             )
 
-        self.arpu_results = self.arpu_test.evaluate()
+        approximation = None
+        lognormal_params = (
+            self.arpu_lognormal_params()
+            if self.fast_path_config().heuristic_arpu and self.eligible_for_fast_path()
+            else None
+        )
+        if lognormal_params is not None:
+            log_sds, scales = lognormal_params
+            # the lognormal is itself an approximation of the ARPU posterior
+            approximation = self.gaussian_fast_path(
+                "arpu", stats.lognorm, guaranteed=False, s=log_sds, scale=scales
+            )
+        if approximation is None:
+            self.arpu_results = self.arpu_test.evaluate()
+        else:
+            self.arpu_results = self.approximated_results(
+                self.arpu_test, *approximation
+            )
 
         # Create the posterior distributions for ARPU
         # For delta-lognormal data, we need to simulate from the model
@@ -185,6 +545,7 @@ class WebsiteExperiment:
             )
 
     def run_revenue_per_sale_experiment(self, sim_count: int = 100_000, show=False):
+        self.approximation_errors.pop("revenue_per_sale", None)
         self.revenue_per_sale_test: ExponentialDataTest = ExponentialDataTest()
         for v in self.variants:
             if v.conversions > 0:
@@ -200,10 +561,36 @@ class WebsiteExperiment:
                     v.name, totals=0, sum_values=0
                 )
 
-        # Higher revenue per sale is better, so min_is_best=False
-        self.revenue_per_sale_results = self.revenue_per_sale_test.evaluate(
-            sim_count=sim_count
-        )
+        approximation = None
+        if self.eligible_for_fast_path(impressions=False):
+            # As in ExponentialDataTest, evaluate the exponential rate, whose
+            # posterior is Gamma(a + totals, b + sum_values), with the lowest rate
+            # (the highest revenue per sale) being best
+            test = self.revenue_per_sale_test
+            shapes = np.add(test.a_priors, test.totals)
+            rates = np.add(test.b_priors, test.sum_values)
+            approximation = self.gaussian_fast_path(
+                "revenue_per_sale",
+                stats.gamma,
+                min_is_best=True,
+                a=shapes,
+                scale=1 / rates,
+            )
+            if approximation is not None:
+                # convert the loss on the rate to a loss on the revenue per sale,
+                # 1 / (mean_rate - loss_rate) - 1 / mean_rate, as the library does
+                pbbs, loss_rate = approximation
+                mean_rate = shapes / rates
+                approximation = pbbs, 1 / (mean_rate - loss_rate) - 1 / mean_rate
+        if approximation is None:
+            # Higher revenue per sale is better, so min_is_best=False
+            self.revenue_per_sale_results = self.revenue_per_sale_test.evaluate(
+                sim_count=sim_count
+            )
+        else:
+            self.revenue_per_sale_results = self.approximated_results(
+                self.revenue_per_sale_test, *approximation
+            )
         if show:
             print(
                 pd.DataFrame(self.revenue_per_sale_results).to_markdown(
@@ -211,6 +598,72 @@ class WebsiteExperiment:
                 )
             )
 
+    def arpu_lognormal_params(self) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Lognormal approximation of the ARPU posterior of each variant, as the
+        `s` and `scale` parameters of scipy's lognorm.
+
+        ARPU is the conversion rate times exp(mu + sigma^2 / 2), with a Beta
+        posterior for the conversion rate and a Normal-Inverse-Gamma posterior
+        for (mu, sigma^2) of the log revenues, as in DeltaLognormalDataTest.
+        The mean and variance of log ARPU are exact, but log ARPU is taken as
+        normal: the fast path bound only measures the distance from this
+        lognormal, not from the true posterior, so it is not guaranteed.
+        Returns None when the variance of sigma^2 is not finite, which needs
+        more than 4 conversions per variant with the default priors.
+        """
+        log_means, log_vars = [], []
+        for i in range(len(self.arpu_test.variant_names)):
+            totals = self.arpu_test.totals[i]
+            positives = self.arpu_test.positives[i]
+            sum_logs = self.arpu_test.sum_logs[i]
+            sum_logs_2 = self.arpu_test.sum_logs_2[i]
+            m_prior = self.arpu_test.m_priors[i]
+            w_prior = self.arpu_test.w_priors[i]
+            a_n = self.arpu_test.a_priors_ig[i] + positives / 2
+            if positives == 0 or a_n <= 2:
+                return None
+
+            alpha = self.arpu_test.a_priors_beta[i] + positives
+            beta = self.arpu_test.b_priors_beta[i] + totals - positives
+            log_conversion_mean = special.digamma(alpha) - special.digamma(alpha + beta)
+            log_conversion_var = special.polygamma(1, alpha) - special.polygamma(
+                1, alpha + beta
+            )
+
+            # Normal-Inverse-Gamma posterior, as in bayesian_testing normal_posteriors
+            x_bar = sum_logs / positives
+            b_n = (
+                self.arpu_test.b_priors_ig[i]
+                + max(sum_logs_2 - 2 * sum_logs * x_bar + positives * x_bar**2, 0) / 2
+                + (positives * w_prior / (2 * (positives + w_prior)))
+                * (x_bar - m_prior) ** 2
+            )
+            m_n = (positives * x_bar + w_prior * m_prior) / (positives + w_prior)
+            sigma_2_mean = b_n / (a_n - 1)
+            sigma_2_var = b_n**2 / ((a_n - 1) ** 2 * (a_n - 2))
+            # log of the lognormal mean: mu + sigma^2 / 2
+            log_value_mean = m_n + sigma_2_mean / 2
+            log_value_var = sigma_2_mean / (positives + w_prior) + sigma_2_var / 4
+
+            log_means.append(log_conversion_mean + log_value_mean)
+            log_vars.append(log_conversion_var + log_value_var)
+        return np.sqrt(log_vars), np.exp(log_means)
+
+    @staticmethod
+    def approximated_results(test, pbbs: list, loss: list) -> List[dict]:
+        # A single draw is enough for the deterministic summary fields of the
+        # test, the simulated ones are replaced by the approximation
+        results = test.evaluate(sim_count=1)
+        for res, prob_being_best, expected_loss in zip(results, pbbs, loss):
+            res.update(
+                {
+                    "prob_being_best": round(float(prob_being_best), 7),
+                    "expected_loss": round(float(expected_loss), 7),
+                }
+            )
+        return results
+
     def run(self, **kargs):
         self.run_conversion_experiment(**kargs)
         self.run_arpu_experiment(**kargs)
@@ -441,6 +894,89 @@ class WebsiteExperiment:
             revenue_per_sale_distributions,
         )
 
+    def get_pairwise_reports(
+        self,
+        sim_count: int = 20_000,
+        seed: int = 42,
+        interval: float = 0.95,
+        probs_precision: int = 4,
+    ):
+        """
+        All-pairs comparison of the variants for conversion, ARPU and revenue
+        per sale, computed from a single set of posterior draws per metric
+        instead of re-running the analysis with each variant as baseline.
+
+        Must be called after `run`, since it reuses the priors and aggregated
+        data of each test. Returns a dict metric -> stat -> N x N DataFrame,
+        where row i, column j compares variant i against variant j.
+        """
+        names = [v.name for v in self.variants]
+        ss = np.random.SeedSequence(seed)
+        child_seeds = ss.spawn(len(names) + 3)
+
+        conversion_samples = beta_posteriors_all(
+            self.conversion_test.totals,
+            self.conversion_test.positives,
+            sim_count,
+            self.conversion_test.a_priors,
+            self.conversion_test.b_priors,
+            child_seeds[0],
+        )
+
+        # ARPU is the conversion rate times the lognormal mean of the revenue per sale,
+        # as in DeltaLognormalDataTest
+        arpu_conversion_samples = beta_posteriors_all(
+            self.arpu_test.totals,
+            self.arpu_test.positives,
+            sim_count,
+            self.arpu_test.a_priors_beta,
+            self.arpu_test.b_priors_beta,
+            child_seeds[1],
+        )
+        lognormal_samples = np.array(
+            [
+                lognormal_posteriors(
+                    self.arpu_test.positives[i],
+                    self.arpu_test.sum_logs[i],
+                    self.arpu_test.sum_logs_2[i],
+                    sim_count,
+                    self.arpu_test.m_priors[i],
+                    self.arpu_test.a_priors_ig[i],
+                    self.arpu_test.b_priors_ig[i],
+                    self.arpu_test.w_priors[i],
+                    child_seeds[2 + i],
+                )
+                for i in range(len(names))
+            ]
+        )
+        arpu_samples = arpu_conversion_samples * lognormal_samples
+
+        # ExponentialDataTest draws the rate, the revenue per sale is its inverse
+        rate_samples = exp_gamma_posteriors_all(
+            self.revenue_per_sale_test.totals,
+            self.revenue_per_sale_test.sum_values,
+            sim_count,
+            self.revenue_per_sale_test.a_priors,
+            self.revenue_per_sale_test.b_priors,
+            child_seeds[2 + len(names)],
+        )
+        revenue_per_sale_samples = 1 / rate_samples
+
+        pairwise = {}
+        for metric, samples in (
+            ("conversion", conversion_samples),
+            ("arpu", arpu_samples),
+            ("revenue_per_sale", revenue_per_sale_samples),
+        ):
+            pairwise[metric] = {
+                stat: pd.DataFrame(matrix, index=names, columns=names).round(
+                    probs_precision
+                )
+                for stat, matrix in pairwise_comparison(samples, interval).items()
+            }
+
+        return pairwise
+
 
 # Pydantic models for API
 class VariantInput(BaseModel):
@@ -467,10 +1003,22 @@ async def home(request: Request):
 
 
 @app.post("/api/analyze")
-async def analyze_experiment(experiment_input: ExperimentInput):
+async def analyze_experiment(
+    experiment_input: ExperimentInput,
+    pairwise: bool = Query(False),
+    profile: bool = Query(False),
+    x_janus_profile: Optional[str] = Header(None),
+    x_janus_admin_token: Optional[str] = Header(None),
+):
     logger.info(
         f"Received experiment analysis request with {len(experiment_input.variants)} variants"
     )
+    profile = profile or x_janus_profile in ("1", "true", "yes")
+    if profile and not is_privileged(x_janus_admin_token):
+        raise HTTPException(
+            status_code=403, detail="Profiling is restricted to admin callers"
+        )
+    profiler = cProfile.Profile() if profile else None
     try:
         # Log input data summary
         logger.info(f"Baseline variant: {experiment_input.baseline_variant}")
@@ -493,6 +1041,9 @@ async def analyze_experiment(experiment_input: ExperimentInput):
         # Create and run experiment
         logger.info("Creating experiment and running analysis")
         experiment = WebsiteExperiment(variants, experiment_input.baseline_variant)
+        if profiler is not None:
+            logger.info("Profiling this analysis request")
+            profiler.enable()
         experiment.run()
 
         # Get reports
@@ -506,6 +1057,11 @@ async def analyze_experiment(experiment_input: ExperimentInput):
             arpu_distributions,
             revenue_per_sale_distributions,
         ) = experiment.get_reports()
+        if pairwise:
+            logger.info("Computing all-pairs comparison")
+            pairwise_reports = experiment.get_pairwise_reports()
+        if profiler is not None:
+            profiler.disable()
 
         # Convert DataFrames to dictionaries
         summary_dict = df_summary.to_dict(orient="records")
@@ -514,7 +1070,7 @@ async def analyze_experiment(experiment_input: ExperimentInput):
         rev_per_sale_dict = df_rev_per_sale.to_dict(orient="records")
 
         logger.info("Successfully completed experiment analysis")
-        return {
+        response = {
             "summary": summary_dict,
             "conversion_stats": conv_dict,
             "arpu_stats": arpu_dict,
@@ -522,8 +1078,30 @@ async def analyze_experiment(experiment_input: ExperimentInput):
             "conversion_distributions": conversion_distributions,
             "arpu_distributions": arpu_distributions,
             "revenue_per_sale_distributions": revenue_per_sale_distributions,
+            "approximation_errors": experiment.approximation_errors,
         }
+        if pairwise:
+            response["pairwise_stats"] = pairwise_stats_to_json(
+                pairwise_reports, [v.name for v in variants]
+            )
+        if profiler is not None:
+            # A profile that cannot be stored must not fail a finished analysis
+            try:
+                profile_id = save_profile(profiler)
+                logger.info(f"Stored profile {profile_id}")
+                response["profile_id"] = profile_id
+            except OSError as save_error:
+                logger.error(f"Could not store profile: {save_error}")
+        return response
     except Exception as e:
+        if profiler is not None:
+            profiler.disable()
+            try:
+                logger.error(
+                    f"Stored profile of failed request: {save_profile(profiler)}"
+                )
+            except OSError as save_error:
+                logger.error(f"Could not store profile of failed request: {save_error}")
         error_msg = f"Error in experiment analysis: {str(e)}"
         stack_trace = traceback.format_exc()
         logger.error(f"{error_msg}\n{stack_trace}")
@@ -542,6 +1120,52 @@ async def analyze_experiment(experiment_input: ExperimentInput):
         )
 
 
+@app.get("/api/admin/profiles")
+async def list_profiles(x_janus_admin_token: Optional[str] = Header(None)):
+    if not is_privileged(x_janus_admin_token):
+        raise HTTPException(status_code=403, detail="Admin token required")
+    profile_dir = get_profile_dir()
+    if not os.path.isdir(profile_dir):
+        return {"profiles": []}
+    return {
+        "profiles": sorted(
+            f[: -len(".prof")] for f in os.listdir(profile_dir) if f.endswith(".prof")
+        )
+    }
+
+
+@app.get("/api/admin/profiles/{profile_id}")
+async def download_profile(
+    profile_id: str,
+    format: str = Query("prof", pattern="^(prof|text)$"),
+    sort: str = Query("cumulative"),
+    limit: int = Query(50, ge=1),
+    x_janus_admin_token: Optional[str] = Header(None),
+):
+    """
+    Download a stored profile, either as a raw pstats file (loadable with
+    pstats, snakeviz or flameprof) or as a text call-tree summary.
+    """
+    if not is_privileged(x_janus_admin_token):
+        raise HTTPException(status_code=403, detail="Admin token required")
+    path = get_profile_path(profile_id)
+    if format == "prof":
+        return FileResponse(
+            path,
+            media_type="application/octet-stream",
+            filename=f"{profile_id}.prof",
+        )
+
+    stream = io.StringIO()
+    try:
+        stats_ = pstats.Stats(path, stream=stream).sort_stats(sort)
+    except KeyError:
+        raise HTTPException(status_code=400, detail=f"Invalid sort key: {sort}")
+    stats_.print_stats(limit)
+    stats_.print_callees(limit)
+    return PlainTextResponse(stream.getvalue())
+
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
@@ -1,6 +1,20 @@
+import cProfile
+import json
+
+import numpy as np
+import pandas as pd
 import pytest
 from fastapi.testclient import TestClient
-from main import app, WebsiteExperiment, Variant
+from main import (
+    app,
+    WebsiteExperiment,
+    Variant,
+    GaussianFastPath,
+    get_fast_path_config,
+    pairwise_comparison,
+    pairwise_stats_to_json,
+    save_profile,
+)
 
 # Create a test client for the FastAPI app
 client = TestClient(app)
@@ -105,3 +119,285 @@ def test_get_reports():
     assert conv_dist is not None
     assert arpu_dist is not None
     assert rev_per_sale_dist is not None
+
+
+PROFILE_PAYLOAD = {
+    "baseline_variant": "A",
+    "variants": [
+        {"name": "A", "impressions": 1000, "conversions": 100, "revenue": 1000.0},
+        {"name": "B", "impressions": 1000, "conversions": 150, "revenue": 1500.0},
+    ],
+}
+
+
+def test_analyze_profiling_requires_admin_token(monkeypatch, tmp_path):
+    monkeypatch.setenv("JANUS_ADMIN_TOKEN", "secret")
+    monkeypatch.setenv("JANUS_PROFILE_DIR", str(tmp_path))
+    response = client.post("/api/analyze?profile=true", json=PROFILE_PAYLOAD)
+    assert response.status_code == 403
+    response = client.post(
+        "/api/analyze",
+        json=PROFILE_PAYLOAD,
+        headers={"X-Janus-Profile": "1", "X-Janus-Admin-Token": "wrong"},
+    )
+    assert response.status_code == 403
+    response = client.post(
+        "/api/analyze?profile=true",
+        json=PROFILE_PAYLOAD,
+        headers={"X-Janus-Admin-Token": b"caf\xe9"},
+    )
+    assert response.status_code == 403
+    response = client.get(
+        "/api/admin/profiles", headers={"X-Janus-Admin-Token": b"caf\xe9"}
+    )
+    assert response.status_code == 403
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_analyze_profiling_stores_downloadable_profile(monkeypatch, tmp_path):
+    monkeypatch.setenv("JANUS_ADMIN_TOKEN", "secret")
+    monkeypatch.setenv("JANUS_PROFILE_DIR", str(tmp_path))
+    headers = {"X-Janus-Admin-Token": "secret"}
+
+    response = client.post("/api/analyze", json=PROFILE_PAYLOAD)
+    assert response.status_code == 200
+    assert "profile_id" not in response.json()
+
+    response = client.post(
+        "/api/analyze",
+        json=PROFILE_PAYLOAD,
+        headers={"X-Janus-Profile": "1", **headers},
+    )
+    assert response.status_code == 200
+    profile_id = response.json()["profile_id"]
+
+    response = client.get("/api/admin/profiles", headers=headers)
+    assert response.json() == {"profiles": [profile_id]}
+    assert client.get("/api/admin/profiles").status_code == 403
+
+    response = client.get(f"/api/admin/profiles/{profile_id}", headers=headers)
+    assert response.status_code == 200
+    assert len(response.content) > 0
+
+    response = client.get(
+        f"/api/admin/profiles/{profile_id}?format=text", headers=headers
+    )
+    assert response.status_code == 200
+    assert "run_arpu_experiment" in response.text
+
+    response = client.get(
+        f"/api/admin/profiles/{profile_id}?format=text&limit=-1", headers=headers
+    )
+    assert response.status_code == 422
+
+    response = client.get("/api/admin/profiles/missing", headers=headers)
+    assert response.status_code == 404
+
+
+def test_get_pairwise_reports():
+    variants = [
+        Variant(name="A", impressions=1000, conversions=100, revenue=1000.0),
+        Variant(name="B", impressions=1000, conversions=150, revenue=1500.0),
+        Variant(name="C", impressions=1000, conversions=5, revenue=20.0),
+    ]
+    experiment = WebsiteExperiment(variants=variants, baseline_variant="A")
+    experiment.run(show=False)
+    pairwise = experiment.get_pairwise_reports(sim_count=5000)
+    assert set(pairwise) == {"conversion", "arpu", "revenue_per_sale"}
+
+    prob = pairwise["conversion"]["prob_being_better"]
+    assert list(prob.index) == ["A", "B", "C"]
+    assert prob.isna().values.diagonal().all()
+    assert prob.loc["B", "A"] > 0.99
+    assert abs(prob.loc["A", "B"] + prob.loc["B", "A"] - 1) < 1e-3
+
+    lift_lower = pairwise["conversion"]["lift_lower"]
+    lift_upper = pairwise["conversion"]["lift_upper"]
+    assert lift_lower.loc["B", "A"] < 0.5 < lift_upper.loc["B", "A"]
+    assert (pairwise["arpu"]["expected_loss"].loc["C"].dropna() > 0).all()
+
+
+def test_analyze_pairwise():
+    payload = {
+        "baseline_variant": "A",
+        "variants": [
+            {"name": "A", "impressions": 1000, "conversions": 100, "revenue": 1000.0},
+            {"name": "B", "impressions": 1000, "conversions": 150, "revenue": 1500.0},
+            {"name": "C", "impressions": 1000, "conversions": 5, "revenue": 20.0},
+        ],
+    }
+    response = client.post("/api/analyze?pairwise=true", json=payload)
+    assert response.status_code == 200
+    pairwise = response.json()["pairwise_stats"]
+    assert pairwise["arpu"]["variants"] == ["A", "B", "C"]
+    assert pairwise["arpu"]["prob_being_better"][0][0] is None
+    assert len(pairwise["revenue_per_sale"]["expected_loss"]) == 3
+
+
+def test_pairwise_stats_to_json_non_finite():
+    # Few conversions with a large ticket can make ARPU draws overflow to inf
+    samples = np.array([[1.0, 2.0, 3.0, np.inf], [2.0, 1.0, 2.0, 1.0]])
+    pairwise = {
+        "arpu": {
+            stat: pd.DataFrame(matrix, index=["A", "B"], columns=["A", "B"])
+            for stat, matrix in pairwise_comparison(samples).items()
+        }
+    }
+    res = pairwise_stats_to_json(pairwise, ["A", "B"])
+    json.dumps(res, allow_nan=False)
+    assert res["arpu"]["expected_loss"][1][0] is None
+    assert res["arpu"]["prob_being_better"][0][1] == 0.75
+
+
+LARGE_VARIANTS = [
+    Variant(name="A", impressions=20_000_000, conversions=200_000, revenue=4_000_000.0),
+    Variant(name="B", impressions=20_000_000, conversions=200_900, revenue=4_010_000.0),
+    Variant(name="C", impressions=20_000_000, conversions=200_500, revenue=4_030_000.0),
+]
+
+
+def test_gaussian_fast_path_matches_simulation():
+    fast = WebsiteExperiment(
+        variants=LARGE_VARIANTS,
+        baseline_variant="A",
+        fast_path=GaussianFastPath(heuristic_arpu=True),
+    )
+    fast.run(show=False)
+    simulated = WebsiteExperiment(
+        variants=LARGE_VARIANTS,
+        baseline_variant="A",
+        fast_path=GaussianFastPath(enabled=False),
+    )
+    simulated.run(sim_count=400_000, show=False)
+
+    assert set(fast.approximation_errors) == {"conversion", "arpu", "revenue_per_sale"}
+    assert fast.approximation_errors["conversion"]["guaranteed"]
+    assert fast.approximation_errors["revenue_per_sale"]["guaranteed"]
+    assert not fast.approximation_errors["arpu"]["guaranteed"]
+    assert simulated.approximation_errors == {}
+    for metric, loss_tolerance in (
+        ("conversion_results", 0.05),
+        ("arpu_results", 0.1),
+    ):
+        for fast_res, sim_res in zip(getattr(fast, metric), getattr(simulated, metric)):
+            assert set(fast_res) == set(sim_res)
+            assert abs(fast_res["prob_being_best"] - sim_res["prob_being_best"]) < 0.02
+            assert fast_res["expected_loss"] == pytest.approx(
+                sim_res["expected_loss"], rel=loss_tolerance, abs=1e-6
+            )
+
+    # The expected loss of revenue per sale follows the library's definition,
+    # computed on the exponential rate. The library rounds that loss to 1e-7,
+    # so compare it back on the rate scale.
+    def loss_rate(res):
+        mean_rate = (0.1 + res["totals"]) / (0.1 + res["sum_values"])
+        return mean_rate - 1 / (1 / mean_rate + res["expected_loss"])
+
+    for fast_res, sim_res in zip(
+        fast.revenue_per_sale_results, simulated.revenue_per_sale_results
+    ):
+        assert set(fast_res) == set(sim_res)
+        assert abs(fast_res["prob_being_best"] - sim_res["prob_being_best"]) < 0.02
+        assert loss_rate(fast_res) == pytest.approx(
+            loss_rate(sim_res), rel=0.01, abs=2e-7
+        )
+
+
+def test_gaussian_fast_path_skips_arpu_by_default():
+    experiment = WebsiteExperiment(variants=LARGE_VARIANTS, baseline_variant="A")
+    experiment.run(show=False)
+    assert set(experiment.approximation_errors) == {"conversion", "revenue_per_sale"}
+
+
+def test_gaussian_fast_path_falls_back_to_simulation():
+    small = WebsiteExperiment(
+        variants=[
+            Variant(name="A", impressions=1000, conversions=100, revenue=1000.0),
+            Variant(name="B", impressions=1000, conversions=150, revenue=1500.0),
+        ],
+        baseline_variant="A",
+    )
+    small.run(show=False)
+    assert small.approximation_errors == {}
+
+    strict = WebsiteExperiment(
+        variants=LARGE_VARIANTS,
+        baseline_variant="A",
+        fast_path=GaussianFastPath(max_error=1e-6),
+    )
+    strict.run(show=False)
+    assert strict.approximation_errors == {}
+
+
+def test_analyze_profiling_unwritable_profile_dir(monkeypatch, tmp_path):
+    monkeypatch.setenv("JANUS_ADMIN_TOKEN", "secret")
+    # a file where the profile directory should be
+    monkeypatch.setenv("JANUS_PROFILE_DIR", str(tmp_path / "profiles"))
+    (tmp_path / "profiles").write_text("")
+    response = client.post(
+        "/api/analyze?profile=true",
+        json=PROFILE_PAYLOAD,
+        headers={"X-Janus-Admin-Token": "secret"},
+    )
+    assert response.status_code == 200
+    assert "profile_id" not in response.json()
+    assert response.json()["summary"]
+
+
+@pytest.mark.parametrize("max_profiles", ["1", "0"])
+def test_save_profile_keeps_latest(monkeypatch, tmp_path, max_profiles):
+    monkeypatch.setenv("JANUS_PROFILE_DIR", str(tmp_path))
+    monkeypatch.setenv("JANUS_MAX_PROFILES", max_profiles)
+    for _ in range(20):
+        profile_id = save_profile(cProfile.Profile())
+        assert [f.name for f in tmp_path.iterdir()] == [f"{profile_id}.prof"]
+
+
+@pytest.mark.parametrize("max_profiles", ["many", "-3"])
+def test_save_profile_invalid_max_profiles(monkeypatch, tmp_path, max_profiles):
+    # invalid values fall back to the default of 50
+    monkeypatch.setenv("JANUS_PROFILE_DIR", str(tmp_path))
+    monkeypatch.setenv("JANUS_MAX_PROFILES", max_profiles)
+    profile_ids = {save_profile(cProfile.Profile()) for _ in range(3)}
+    assert {f.stem for f in tmp_path.iterdir()} == profile_ids
+
+
+def test_gaussian_fast_path_rejects_undefined_bounds():
+    # Too few conversions for the ARPU lognormal variance to be finite
+    experiment = WebsiteExperiment(
+        variants=[
+            Variant(name="A", impressions=1000, conversions=3, revenue=30.0),
+            Variant(name="B", impressions=1000, conversions=4, revenue=50.0),
+        ],
+        baseline_variant="A",
+        fast_path=GaussianFastPath(
+            min_impressions=0, min_conversions=1, max_error=0.5, heuristic_arpu=True
+        ),
+    )
+    experiment.run(show=False)
+    assert "arpu" not in experiment.approximation_errors
+    for res in experiment.conversion_results + experiment.arpu_results:
+        assert np.isfinite(res["prob_being_best"])
+
+
+def test_gaussian_fast_path_reads_environment(monkeypatch):
+    monkeypatch.setenv("JANUS_FAST_PATH_MIN_CONVERSIONS", "1000000")
+    experiment = WebsiteExperiment(variants=LARGE_VARIANTS, baseline_variant="A")
+    experiment.run(show=False)
+    assert experiment.approximation_errors == {}
+
+    monkeypatch.delenv("JANUS_FAST_PATH_MIN_CONVERSIONS")
+    monkeypatch.setenv("JANUS_FAST_PATH_ENABLED", "false")
+    experiment.run(show=False)
+    assert experiment.approximation_errors == {}
+
+
+def test_gaussian_fast_path_invalid_environment(monkeypatch):
+    monkeypatch.setenv("JANUS_FAST_PATH_MIN_IMPRESSIONS", "1e6")
+    monkeypatch.setenv("JANUS_FAST_PATH_MAX_ERROR", "-1")
+    assert get_fast_path_config() == GaussianFastPath()
+
+    monkeypatch.setenv("JANUS_FAST_PATH_HEURISTIC_ARPU", "true")
+    experiment = WebsiteExperiment(variants=LARGE_VARIANTS, baseline_variant="A")
+    experiment.run(show=False)
+    assert "arpu" in experiment.approximation_errors